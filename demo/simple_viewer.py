@@ -22,7 +22,7 @@ This small application demonstrates the basic usage of the PictureView
 widget. 
 Run
     python simple_viewer.py /path/to/picture
-to see it in action.
+to see it in action. Without a path the last session is restored.
 
 Author: Sven Festersen (sven@sven-festersen.de)
 Homepage: http://sven-festersen.de
@@ -59,13 +59,15 @@ if __name__ == "__main__":
     w = gtk.Window()
     w.resize(400, 300)
     w.connect("destroy", gtk.main_quit)
-    if len(sys.argv) < 2:
-        #no path to picture given => show blank view
-        pw = PictureView()
-    else:
-        pw = PictureView(sys.argv[1])
+    pw = PictureView()
     pw.connect("zoom-changed", cb_zoom, w)
     pw.connect("filename-changed", cb_filename, w)
+    pw.set_session_file(os.path.expanduser("~/.picture_view_session"))
+    if len(sys.argv) < 2:
+        #no path to picture given => restore the last session
+        pw.restore_session()
+    else:
+        pw.set_filename(sys.argv[1])
     pw.set_background_color(gtk.gdk.color_parse("#424242"))
     w.add(pw)
     w.show_all()
@@ -0,0 +1,284 @@
+#!/usr/bin/env python
+#
+#       PictureView
+#       Copyright 2009 Sven Festersen
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+"""
+Asynchronous picture loading. A Loader decodes pictures in a small
+number of worker threads, the result of every request is delivered
+by a LoadFuture whose callbacks are run in the GLib main loop.
+
+Author: Sven Festersen (sven@sven-festersen.de)
+Homepage: http://sven-festersen.de
+License: GPL (see above)
+"""
+import gobject
+import gtk
+import heapq
+import threading
+
+PRIORITY_VISIBLE = 0
+PRIORITY_PREFETCH = 1
+
+MAX_DECODES = 2
+
+STATE_PENDING = 0
+STATE_RUNNING = 1
+STATE_DONE = 2
+STATE_CANCELLED = 3
+
+#the main loop has to release the GIL for the worker threads
+gobject.threads_init()
+
+
+class CancelledError(Exception):
+    """
+    Raised by LoadFuture.result() if the load was cancelled.
+    """
+    pass
+
+
+class LoadFuture(object):
+    """
+    The result of a picture load requested by Loader.load(). Once the
+    load is finished, failed or cancelled, the callbacks added with
+    add_done_callback() are called in the main loop.
+    """
+    
+    def __init__(self, path, priority):
+        self.path = path
+        self.priority = priority
+        self._state = STATE_PENDING
+        self._pixbuf = None
+        self._exception = None
+        self._callbacks = []
+        #guards the state transitions, the worker thread and the main
+        #loop change the state
+        self._lock = threading.Lock()
+        
+    def _set_running(self):
+        #called by the worker thread
+        self._lock.acquire()
+        try:
+            if self._state == STATE_PENDING:
+                self._state = STATE_RUNNING
+                return True
+            return False
+        finally:
+            self._lock.release()
+        
+    def _resolve(self, pixbuf, exception):
+        #called in the main loop
+        self._lock.acquire()
+        try:
+            if self._state not in [STATE_PENDING, STATE_RUNNING]:
+                return False
+            self._pixbuf = pixbuf
+            self._exception = exception
+            self._state = STATE_DONE
+        finally:
+            self._lock.release()
+        self._run_callbacks()
+        return False
+        
+    def _run_callbacks(self):
+        callbacks = self._callbacks
+        self._callbacks = []
+        for callback, args in callbacks:
+            callback(self, *args)
+            
+    def cancel(self):
+        """
+        Cancel the load. A load that is already being decoded can not
+        be stopped, but its result is dropped.
+        Returns False if the load was already finished.
+        
+        @return: boolean.
+        """
+        self._lock.acquire()
+        try:
+            if self._state == STATE_DONE:
+                return False
+            if self._state == STATE_CANCELLED:
+                return True
+            self._state = STATE_CANCELLED
+        finally:
+            self._lock.release()
+        gobject.idle_add(self._run_callbacks)
+        return True
+        
+    def cancelled(self):
+        """
+        Returns True if the load was cancelled.
+        
+        @return: boolean.
+        """
+        return self._state == STATE_CANCELLED
+        
+    def running(self):
+        """
+        Returns True if the picture is being decoded right now.
+        
+        @return: boolean.
+        """
+        return self._state == STATE_RUNNING
+        
+    def done(self):
+        """
+        Returns True if the load is finished, failed or was cancelled.
+        
+        @return: boolean.
+        """
+        return self._state in [STATE_DONE, STATE_CANCELLED]
+        
+    def result(self):
+        """
+        Returns the loaded picture. If the load failed, the exception
+        raised while decoding is raised again. Raises CancelledError if
+        the load was cancelled.
+        
+        @return: gtk.gdk.Pixbuf.
+        """
+        if self._state == STATE_CANCELLED:
+            raise CancelledError, "Loading %s was cancelled." % self.path
+        if self._state != STATE_DONE:
+            raise RuntimeError, "Loading %s is not finished." % self.path
+        if self._exception != None:
+            raise self._exception
+        return self._pixbuf
+        
+    def exception(self):
+        """
+        Returns the exception raised while decoding the picture or None
+        if the load succeeded.
+        
+        @return: an exception or None.
+        """
+        if self._state == STATE_CANCELLED:
+            raise CancelledError, "Loading %s was cancelled." % self.path
+        if self._state != STATE_DONE:
+            raise RuntimeError, "Loading %s is not finished." % self.path
+        return self._exception
+        
+    def set_result(self, pixbuf):
+        """
+        Finish the load with pixbuf as result. Has to be called in the
+        main loop, has no effect if the load was cancelled or is
+        finished.
+        
+        @type pixbuf: gtk.gdk.Pixbuf.
+        """
+        self._resolve(pixbuf, None)
+        
+    def set_exception(self, exception):
+        """
+        Let the load fail with exception. Has to be called in the main
+        loop, has no effect if the load was cancelled or is finished.
+        
+        @type exception: an exception.
+        """
+        self._resolve(None, exception)
+        
+    def add_done_callback(self, callback, *args):
+        """
+        Add a function that is called as callback(future, *args) in the
+        main loop when the load is finished, failed or was cancelled.
+        If that already happened, callback is called in the next main
+        loop iteration.
+        
+        @param callback: the function to call
+        @type callback: callable.
+        """
+        self._callbacks.append((callback, args))
+        if self.done():
+            gobject.idle_add(self._run_callbacks)
+
+
+class Loader(object):
+    """
+    Decodes pictures in at most max_decodes worker threads. Requests
+    with a lower priority value (PRIORITY_VISIBLE) are decoded before
+    requests with a higher one (PRIORITY_PREFETCH), requests with the
+    same priority in the order they were made.
+    A Loader can be shared between several PictureViews to limit the
+    number of concurrent decodes of an application.
+    """
+    
+    def __init__(self, max_decodes=MAX_DECODES):
+        self._max_decodes = max_decodes
+        self._queue = []
+        self._count = 0
+        self._workers = []
+        self._condition = threading.Condition()
+        
+    def load(self, path, priority=PRIORITY_VISIBLE):
+        """
+        Request to load the picture given by path.
+        
+        @param path: the path to the picture
+        @type path: string
+        @param priority: PRIORITY_VISIBLE or PRIORITY_PREFETCH
+        @type priority: int.
+        
+        @return: LoadFuture.
+        """
+        future = LoadFuture(path, priority)
+        self._condition.acquire()
+        try:
+            heapq.heappush(self._queue, (priority, self._count, future))
+            self._count += 1
+            if len(self._workers) < self._max_decodes:
+                worker = threading.Thread(target=self._work)
+                worker.setDaemon(True)
+                self._workers.append(worker)
+                worker.start()
+            self._condition.notify()
+        finally:
+            self._condition.release()
+        return future
+        
+    def _work(self):
+        while True:
+            self._condition.acquire()
+            try:
+                while not self._queue:
+                    self._condition.wait()
+                priority, count, future = heapq.heappop(self._queue)
+            finally:
+                self._condition.release()
+            if not future._set_running(): continue
+            try:
+                pixbuf = gtk.gdk.pixbuf_new_from_file(future.path)
+            except Exception, e:
+                gobject.idle_add(future._resolve, None, e)
+            else:
+                gobject.idle_add(future._resolve, pixbuf, None)
+
+
+_default_loader = None
+
+def get_default_loader():
+    """
+    Returns the Loader that is shared by all PictureViews unless
+    another one is set with PictureView.set_loader().
+    
+    @return: Loader.
+    """
+    global _default_loader
+    if _default_loader == None:
+        _default_loader = Loader()
+    return _default_loader
@@ -0,0 +1,182 @@
+#!/usr/bin/env python
+#
+#       PictureView
+#       Copyright 2009 Sven Festersen
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+"""
+Session snapshots of a PictureView. A snapshot holds the file list
+together with the modification time of its directory, the current
+picture, the zoom settings and a screen-sized render of the picture
+(the visible part of it in MODE_FIXED_ZOOM, together with the scroll
+position), so a view can be painted right away on the next start.
+The state is stored as JSON in the session file, the render as PNG in
+the same place with '.png' appended.
+
+Author: Sven Festersen (sven@sven-festersen.de)
+Homepage: http://sven-festersen.de
+License: GPL (see above)
+"""
+import gobject
+import gtk
+import json
+import os
+
+SNAPSHOT_VERSION = 2
+
+
+def get_dir_mtime(dir):
+    """
+    Returns the modification time of the directory dir or None if it
+    does not exist.
+    """
+    try:
+        return os.stat(dir).st_mtime
+    except OSError:
+        return None
+
+
+class Snapshot(object):
+    """
+    The state of a PictureView that is saved when the view is closed.
+    """
+    
+    def __init__(self):
+        self.filename = ""
+        self.dir = ""
+        self.dir_mtime = None
+        self.file_list = []
+        self.index = 0
+        self.file_mode = 0
+        self.mode = 0
+        self.zoom = 1.0
+        self.scroll_x = 0.0
+        self.scroll_y = 0.0
+        self.extensions = []
+        self.render = None
+        
+    def is_current(self, extensions):
+        """
+        Returns True if the directory was not modified since the
+        snapshot was taken, the current picture still exists and the
+        supported extensions are the same, i.e. the file list can be
+        used without rescanning the directory.
+        
+        @param extensions: the currently supported extensions
+        @type extensions: list of strings.
+        
+        @return: boolean.
+        """
+        return self.dir_mtime != None and\
+                get_dir_mtime(self.dir) == self.dir_mtime and\
+                os.path.isfile(self.filename) and\
+                sorted(self.extensions) == sorted(extensions)
+                
+    def save(self, filename):
+        """
+        Save the snapshot to the session file filename.
+        
+        @type filename: string.
+        """
+        data = {"version": SNAPSHOT_VERSION,
+                "filename": self.filename,
+                "dir": self.dir,
+                "dir_mtime": self.dir_mtime,
+                "file_list": self.file_list,
+                "index": self.index,
+                "file_mode": self.file_mode,
+                "mode": self.mode,
+                "zoom": self.zoom,
+                "scroll_x": self.scroll_x,
+                "scroll_y": self.scroll_y,
+                "extensions": self.extensions}
+        #write to temporary files first, so an interrupted save does
+        #not leave a broken session behind
+        render_filename = filename + ".png"
+        try:
+            if self.render != None:
+                self.render.save(render_filename + ".tmp", "png")
+            f = open(filename + ".tmp", "w")
+            try:
+                #paths are byte strings in any encoding, latin-1 maps
+                #every byte to a character and back
+                json.dump(data, f, encoding="latin-1")
+            finally:
+                f.close()
+            if self.render != None:
+                _replace(render_filename + ".tmp", render_filename)
+            elif os.path.isfile(render_filename):
+                os.remove(render_filename)
+            _replace(filename + ".tmp", filename)
+        except:
+            for tmp in [filename + ".tmp", render_filename + ".tmp"]:
+                if os.path.isfile(tmp):
+                    os.remove(tmp)
+            raise
+
+
+def _replace(src, dst):
+    #os.rename() does not overwrite existing files on Windows
+    if os.name == "nt" and os.path.isfile(dst):
+        os.remove(dst)
+    os.rename(src, dst)
+
+def _encode(path):
+    #json returns unicode strings, but paths are byte strings (see
+    #Snapshot.save())
+    if isinstance(path, unicode):
+        return path.encode("latin-1")
+    return path
+
+def load_snapshot(filename):
+    """
+    Load the snapshot saved in the session file filename. Returns None
+    if there is no valid snapshot.
+    
+    @type filename: string.
+    
+    @return: Snapshot or None.
+    """
+    try:
+        f = open(filename)
+        try:
+            data = json.load(f)
+        finally:
+            f.close()
+    except (IOError, ValueError):
+        return None
+    if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+        return None
+    snapshot = Snapshot()
+    try:
+        snapshot.filename = _encode(data["filename"])
+        snapshot.dir = _encode(data["dir"])
+        snapshot.dir_mtime = data["dir_mtime"]
+        snapshot.file_list = map(_encode, data["file_list"])
+        snapshot.index = int(data["index"])
+        snapshot.file_mode = int(data["file_mode"])
+        snapshot.mode = int(data["mode"])
+        snapshot.zoom = float(data["zoom"])
+        snapshot.scroll_x = float(data["scroll_x"])
+        snapshot.scroll_y = float(data["scroll_y"])
+        snapshot.extensions = data["extensions"]
+    except (KeyError, TypeError, ValueError):
+        return None
+    try:
+        snapshot.render = gtk.gdk.pixbuf_new_from_file(filename + ".png")
+    except gobject.GError:
+        snapshot.render = None
+    return snapshot
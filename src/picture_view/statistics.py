@@ -0,0 +1,225 @@
+#!/usr/bin/env python
+#
+#       PictureView
+#       Copyright 2009 Sven Festersen
+#
+#       This program is free software; you can redistribute it and/or modify
+#       it under the terms of the GNU General Public License as published by
+#       the Free Software Foundation; either version 2 of the License, or
+#       (at your option) any later version.
+#
+#       This program is distributed in the hope that it will be useful,
+#       but WITHOUT ANY WARRANTY; without even the implied warranty of
+#       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#       GNU General Public License for more details.
+#
+#       You should have received a copy of the GNU General Public License
+#       along with this program; if not, write to the Free Software
+#       Foundation, Inc., 51 Franklin Street, Fifth Floor, Boston,
+#       MA 02110-1301, USA.
+"""
+Histogram and basic statistics (min, max, mean, clipped pixels) of a
+gtk.gdk.Pixbuf. The pixel data is read as a numpy array without
+copying it and the statistics are computed on a downsampled level of
+the picture.
+numpy is required for this module.
+
+Author: Sven Festersen (sven@sven-festersen.de)
+Homepage: http://sven-festersen.de
+License: GPL (see above)
+"""
+import gobject
+import gtk
+import math
+
+try:
+    import numpy
+    from numpy.lib.stride_tricks import as_strided
+except ImportError:
+    numpy = None
+
+CHANNELS = ["r", "g", "b", "luma"]
+
+COARSE_SAMPLES = 64 * 64
+FINE_SAMPLES = 512 * 512
+
+
+def pixbuf_to_array(pixbuf):
+    """
+    Returns the pixels of pixbuf as a numpy array with the shape
+    (height, width, channels). The array shares its memory with the
+    pixbuf if PyGTK was built with numpy support, otherwise the pixel
+    data is copied once.
+    
+    @type pixbuf: gtk.gdk.Pixbuf.
+    
+    @return: numpy.ndarray.
+    """
+    if numpy == None:
+        raise ImportError, "numpy is required for image statistics."
+    try:
+        return numpy.asarray(pixbuf.get_pixels_array())
+    except RuntimeError:
+        #PyGTK was built without numpy support
+        pass
+    height = pixbuf.get_height()
+    width = pixbuf.get_width()
+    channels = pixbuf.get_n_channels()
+    data = numpy.frombuffer(pixbuf.get_pixels(), numpy.uint8)
+    #the last row is not padded to the rowstride
+    return as_strided(data, (height, width, channels),
+                        (pixbuf.get_rowstride(), channels, 1))
+
+def compute_statistics(pixbuf, max_samples=FINE_SAMPLES):
+    """
+    Compute the statistics of pixbuf. Only every n-th pixel of every
+    n-th row is used, n is chosen such that at most max_samples pixels
+    are sampled.
+    
+    @type pixbuf: gtk.gdk.Pixbuf
+    @param max_samples: maximum number of pixels to sample
+    @type max_samples: int.
+    
+    @return: ImageStatistics.
+    """
+    pixels = pixbuf_to_array(pixbuf)
+    height, width = pixels.shape[:2]
+    step = max(1, int(math.ceil(math.sqrt(float(width * height) / max_samples))))
+    return ImageStatistics(pixels[::step, ::step, :3], step)
+
+
+class ImageStatistics(object):
+    """
+    Histogram, min, max, mean and clipped pixel counts of the red,
+    green, blue and luma channels of a picture. Every attribute is a
+    dict with the channel names in CHANNELS as keys.
+    The counts refer to the sampled pixels (see samples and step).
+    """
+    
+    def __init__(self, pixels, step=1):
+        self.step = step
+        self.samples = pixels.shape[0] * pixels.shape[1]
+        red = pixels[:, :, 0].astype(numpy.uint32)
+        green = pixels[:, :, 1].astype(numpy.uint32)
+        blue = pixels[:, :, 2].astype(numpy.uint32)
+        luma = (299 * red + 587 * green + 114 * blue + 500) // 1000
+        
+        self.histogram = {}
+        self.min = {}
+        self.max = {}
+        self.mean = {}
+        self.clipped_low = {}
+        self.clipped_high = {}
+        values = numpy.arange(256)
+        for name, channel in zip(CHANNELS, [red, green, blue, luma]):
+            histogram = numpy.bincount(channel.ravel(), minlength=256)
+            used = numpy.flatnonzero(histogram)
+            self.histogram[name] = histogram
+            self.min[name] = int(used[0])
+            self.max[name] = int(used[-1])
+            self.mean[name] = float(numpy.dot(histogram, values)) / self.samples
+            self.clipped_low[name] = int(histogram[0])
+            self.clipped_high[name] = int(histogram[255])
+
+
+class StatisticsPanel(gtk.HBox):
+    """
+    A widget that shows the histogram and the statistics of a pixbuf.
+    After the pixbuf is changed, the statistics are computed on a
+    coarse level first and refined when the main loop is idle.
+    """
+    
+    def __init__(self):
+        if numpy == None:
+            raise ImportError, "numpy is required for image statistics."
+        gtk.HBox.__init__(self)
+        self.set_spacing(6)
+        self.set_border_width(6)
+        
+        self._pixbuf = None
+        self._statistics = None
+        self._levels = []
+        self._source_id = None
+        
+        self._area = gtk.DrawingArea()
+        self._area.set_size_request(256, 100)
+        self._area.connect("expose-event", self._cb_expose)
+        self._label = gtk.Label()
+        self._label.set_alignment(0.0, 0.5)
+        
+        self.pack_start(self._area, False, False)
+        self.pack_start(self._label)
+        
+    def _cb_compute(self):
+        self._statistics = compute_statistics(self._pixbuf, self._levels.pop(0))
+        self._update()
+        if self._levels and self._statistics.step > 1:
+            return True
+        self._source_id = None
+        return False
+        
+    def _update(self):
+        self._area.queue_draw()
+        if self._statistics == None:
+            self._label.set_label("")
+            return
+        s = self._statistics
+        lines = []
+        for name in CHANNELS:
+            lines.append("%s: %s-%s, mean %.1f, clipped %.1f%%/%.1f%%" %\
+                    (name.capitalize(), s.min[name], s.max[name],
+                    s.mean[name], 100.0 * s.clipped_low[name] / s.samples,
+                    100.0 * s.clipped_high[name] / s.samples))
+        self._label.set_label("\n".join(lines))
+        
+    def _cb_expose(self, area, event):
+        cr = area.window.cairo_create()
+        x, y, width, height = area.get_allocation()
+        cr.set_source_rgb(0.1, 0.1, 0.1)
+        cr.paint()
+        if self._statistics == None: return
+        
+        histograms = self._statistics.histogram
+        #clipped pixels are left out when scaling the histogram
+        peak = max([histograms[name][1:255].max() for name in CHANNELS])
+        peak = float(max(peak, 1))
+        colors = {"luma": (0.8, 0.8, 0.8), "r": (1.0, 0.0, 0.0),
+                    "g": (0.0, 1.0, 0.0), "b": (0.0, 0.0, 1.0)}
+        for name in ["luma", "r", "g", "b"]:
+            histogram = histograms[name]
+            cr.move_to(0, height)
+            for i in range(256):
+                h = min(1.0, histogram[i] / peak) * height
+                cr.line_to(i * width / 255.0, height - h)
+            cr.line_to(width, height)
+            cr.close_path()
+            r, g, b = colors[name]
+            cr.set_source_rgba(r, g, b, 0.4)
+            cr.fill()
+            
+    def set_pixbuf(self, pixbuf):
+        """
+        Set the pixbuf whose statistics should be shown. The statistics
+        are (re)computed only if pixbuf changed.
+        
+        @type pixbuf: gtk.gdk.Pixbuf or None.
+        """
+        if pixbuf is self._pixbuf: return
+        if self._source_id != None:
+            gobject.source_remove(self._source_id)
+            self._source_id = None
+        self._pixbuf = pixbuf
+        self._statistics = None
+        if pixbuf != None:
+            self._levels = [COARSE_SAMPLES, FINE_SAMPLES]
+            self._source_id = gobject.idle_add(self._cb_compute)
+        self._update()
+        
+    def get_statistics(self):
+        """
+        Returns the statistics shown or None if they are not computed
+        yet.
+        
+        @return: ImageStatistics or None.
+        """
+        return self._statistics
@@ -30,10 +30,21 @@ Author: Sven Festersen (sven@sven-festersen.de)
 Homepage: http://sven-festersen.de
 License: GPL (see above)
 """
+import fnmatch
 import gobject
 import gtk
 import os
 import pygtk
+import threading
+import time
+
+from picture_view.loader import PRIORITY_VISIBLE, PRIORITY_PREFETCH,\
+                                    LoadFuture, get_default_loader
+from picture_view.session import Snapshot, get_dir_mtime, load_snapshot
+
+#the tree walker and the session check run in threads, so the main
+#loop has to release the GIL while it waits
+gobject.threads_init()
 
 
 def get_supported_extensions():
@@ -55,6 +66,7 @@ MODE_FIXED_ZOOM = 1
 FILEMODE_DIR = 0
 FILEMODE_SINGLE = 1
 FILEMODE_LIST = 2
+FILEMODE_TREE = 3
 
 
 def get_image_files(dir):
@@ -76,6 +88,122 @@ def is_image(filename):
     fnlow = filename.lower()
     base, ext = os.path.splitext(fnlow)
     return ext.strip(".") in SUPPORTED_EXTENSIONS
+    
+def is_excluded(name, exclude):
+    """
+    Test if the file or directory name matches one of the shell-style
+    patterns in the list exclude.
+    """
+    for pattern in exclude:
+        if fnmatch.fnmatch(name, pattern):
+            return True
+    return False
+    
+def walk_image_files(dir, max_depth=-1, exclude=None, cancel=None):
+    """
+    Generator that yields the absolute paths of all image files in the
+    directory dir and its subdirectories that are supported by
+    gtk.gdk.Pixbuf. The files of a directory are yielded (sorted)
+    before the files of its subdirectories.
+    
+    @param dir: the directory to walk
+    @param max_depth: the maximum depth of subdirectories to descend
+    into (0 = only dir itself, -1 = unlimited)
+    @param exclude: list of shell-style patterns; files and directories
+    whose names match one of them are skipped
+    @param cancel: a threading.Event, the walk stops once it is set
+    """
+    for path in _walk_tree(dir, max_depth, exclude, cancel):
+        if path != None:
+            yield path
+            
+def _walk_tree(dir, max_depth=-1, exclude=None, cancel=None):
+    #like walk_image_files(), but yields None after every directory
+    if exclude is None:
+        exclude = []
+    stack = [(os.path.abspath(dir), 0)]
+    while stack:
+        if cancel is not None and cancel.isSet():
+            return
+        current, depth = stack.pop()
+        try:
+            names = os.listdir(current)
+        except OSError:
+            continue
+        names.sort()
+        subdirs = []
+        for name in names:
+            if cancel is not None and cancel.isSet():
+                return
+            if is_excluded(name, exclude): continue
+            path = os.path.join(current, name)
+            if os.path.isdir(path):
+                #do not follow symlinked directories to avoid loops
+                if os.path.islink(path): continue
+                if max_depth < 0 or depth < max_depth:
+                    subdirs.append(path)
+            elif is_image(name):
+                yield path
+        subdirs.reverse()
+        for path in subdirs:
+            stack.append((path, depth + 1))
+        yield None
+
+
+class TreeWalker(threading.Thread):
+    """
+    A thread that walks a directory tree (see walk_image_files()) and
+    passes the image files found to callback in batches. callback is
+    called in the main loop as callback(walker, files, finished).
+    """
+    
+    def __init__(self, dir, callback, max_depth=-1, exclude=None,
+                    batch_size=64, batch_interval=0.2):
+        threading.Thread.__init__(self)
+        self.setDaemon(True)
+        self._dir = dir
+        self._callback = callback
+        self._max_depth = max_depth
+        self._exclude = exclude
+        self._batch_size = batch_size
+        self._batch_interval = batch_interval
+        self._cancel = threading.Event()
+        
+    def run(self):
+        batch = []
+        published = False
+        last = time.time()
+        for path in _walk_tree(self._dir, self._max_depth,
+                                self._exclude, self._cancel):
+            #None marks the end of a directory, so the interval is also
+            #checked while walking directories without images
+            if path != None:
+                batch.append(path)
+            if not batch: continue
+            now = time.time()
+            if not published or len(batch) >= self._batch_size or\
+                    now - last >= self._batch_interval:
+                #the first image is passed on immediately
+                gobject.idle_add(self._callback, self, batch, False)
+                batch = []
+                published = True
+                last = now
+        if not self._cancel.isSet():
+            gobject.idle_add(self._callback, self, batch, True)
+            
+    def cancel(self):
+        """
+        Stop the walk. No more batches are passed to the callback.
+        """
+        self._cancel.set()
+        
+    def is_cancelled(self):
+        """
+        Returns True if the walk was cancelled.
+        
+        @return: boolean.
+        """
+        return self._cancel.isSet()
 
 
 class PictureView(gtk.VBox):
@@ -85,7 +213,7 @@ class PictureView(gtk.VBox):
                                 0, 1, 0, gobject.PARAM_READWRITE),
                         "file-mode": (gobject.TYPE_INT, "file mode",
                                 "The file mode of the view.",
-                                0, 2, 0, gobject.PARAM_READWRITE),
+                                0, 3, 0, gobject.PARAM_READWRITE),
                         "filename": (gobject.TYPE_STRING, "filename",
                                 "The picture filename.", "",
                                 gobject.PARAM_READWRITE),
@@ -102,6 +230,17 @@ class PictureView(gtk.VBox):
                         "fullscreen": (gobject.TYPE_BOOLEAN,
                                             "set fullscreen",
                                             "Set whether to display the image in fullscreen mode",
+                                            False, gobject.PARAM_READWRITE),
+                        "tree-max-depth": (gobject.TYPE_INT, "tree max depth",
+                                "Maximum depth of subdirectories in tree mode (-1 = unlimited).",
+                                -1, gobject.G_MAXINT, -1, gobject.PARAM_READWRITE),
+                        "tree-exclude": (gobject.TYPE_PYOBJECT,
+                                            "tree exclude patterns",
+                                            "Patterns of files and directories to skip in tree mode.",
+                                            gobject.PARAM_READWRITE),
+                        "show-statistics": (gobject.TYPE_BOOLEAN,
+                                            "show statistics",
+                                            "Set whether to show the histogram and image statistics.",
                                             False, gobject.PARAM_READWRITE)}
                                 
     __gsignals__ = {"zoom-changed": (gobject.SIGNAL_RUN_LAST,
@@ -109,7 +248,11 @@ class PictureView(gtk.VBox):
                                         (gobject.TYPE_FLOAT,)),
                     "filename-changed": (gobject.SIGNAL_RUN_LAST,
                                         gobject.TYPE_NONE,
-                                        (gobject.TYPE_STRING,))}
+                                        (gobject.TYPE_STRING,)),
+                    "load-failed": (gobject.SIGNAL_RUN_LAST,
+                                        gobject.TYPE_NONE,
+                                        (gobject.TYPE_STRING,
+                                        gobject.TYPE_STRING))}
     
     def __init__(self, filename=""):
         gtk.VBox.__init__(self)
@@ -128,7 +271,20 @@ class PictureView(gtk.VBox):
         self._file_list = []
         self._index = 0
         self._pixbuf = None
+        self._render = None
+        self._restore_scroll = None
         self._background_color = gtk.gdk.Color()
+        self._tree_walker = None
+        self._tree_keep_list = False
+        self._tree_max_depth = -1
+        self._tree_exclude = []
+        self._loader = get_default_loader()
+        self._pending_load = None
+        self._prefetch_load = None
+        self._direction = 1
+        self._show_statistics = False
+        self._statistics_panel = None
+        self._session_file = ""
             
         self._init_image()
         self._init_controls()
@@ -137,6 +293,7 @@ class PictureView(gtk.VBox):
         self.connect("key-press-event", self._cb_key_press_event)
         self.connect("filename-changed", self._cb_filename_changed)
         self.connect("size-allocate", self._cb_allocate)
+        self.connect("destroy", self._cb_destroy)
         
         if filename:
             self.set_property("filename", filename)
@@ -152,16 +309,100 @@ class PictureView(gtk.VBox):
                 self._index= 0
             self._dir = dir
             
+    def _init_file_tree(self, dir, keep_list=False):
+        if dir != self._dir:
+            self.cancel_tree_walk()
+            #if keep_list is True, the old list is shown until the first
+            #batch arrives
+            self._tree_keep_list = keep_list
+            if not keep_list:
+                self._file_list = []
+                self._index = 0
+            self._dir = dir
+            self._tree_walker = TreeWalker(dir, self._cb_tree_batch,
+                                            self._tree_max_depth,
+                                            self._tree_exclude)
+            self._tree_walker.start()
+            
+    def _in_tree(self, path):
+        return self._dir != "" and path.startswith(self._dir + os.sep)
+            
+    def _cb_tree_batch(self, walker, files, finished):
+        if walker != self._tree_walker or walker.is_cancelled():
+            return False
+        if finished:
+            self._tree_walker = None
+        if self._tree_keep_list and (files or finished):
+            self._tree_keep_list = False
+            self._file_list = []
+            self._index = 0
+        outer = self._pending_load
+        if outer == None or outer.path != self._dir:
+            outer = None
+        if finished and not files and not self._file_list:
+            message = "No image found in %s" % self._dir
+            if outer != None:
+                outer.set_exception(IOError(message))
+            elif not os.path.isfile(self._filename):
+                self.emit("load-failed", self._dir, message)
+        if not files:
+            self._update_info_label()
+            return False
+        offset = len(self._file_list)
+        self._file_list.extend(files)
+        if self._filename in files:
+            self._index = offset + files.index(self._filename)
+        elif offset == 0 and not os.path.isfile(self._filename):
+            #the tree root was given as a directory: show the first image
+            self._index = 0
+            if outer != None:
+                self._chain_load(outer, files[0])
+            else:
+                self._try_load_path(files[0])
+            return False
+        self._update_info_label()
+        return False
+            
+    def _take_prefetch(self, path):
+        #a synchronous load supersedes the asynchronous ones; returns the
+        #prefetched picture if it is path
+        if self._pending_load != None:
+            self._pending_load.cancel()
+            self._pending_load = None
+        prefetch = self._prefetch_load
+        self._prefetch_load = None
+        if prefetch == None: return None
+        if prefetch.path == path and prefetch.done() and\
+                not prefetch.cancelled() and prefetch.exception() == None:
+            return prefetch.result()
+        prefetch.cancel()
+        return None
+            
+    def _try_load_path(self, path):
+        try:
+            self._load_path(path)
+        except gobject.GError, e:
+            self.emit("load-failed", os.path.abspath(path), str(e))
+            
     def _load_path(self, path):
         path = os.path.abspath(path)
+        pixbuf = self._take_prefetch(path)
         if os.path.isfile(path) and is_image(path):
+            if pixbuf == None:
+                pixbuf = gtk.gdk.pixbuf_new_from_file(path)
+            self._show_pixbuf(path, pixbuf)
+        elif os.path.isdir(path) and self._file_mode == FILEMODE_TREE:
+            if path == self._dir and self._file_list:
+                #the tree is known already: show its first image
+                self._index = 0
+                self._load_path(self._file_list[0])
+                return
+            if path == self._dir and self._tree_walker == None:
+                #walk the tree again if it was empty or cancelled
+                self._dir = ""
+            #images are loaded as soon as the first batch arrives
             self._filename = path
-            self._pixbuf = gtk.gdk.pixbuf_new_from_file(self._filename)
-            self._scale_pixbuf()
-            if self._file_mode != FILEMODE_LIST:
-                self._init_file_list(os.path.dirname(self._filename))
-            self.emit("filename-changed", self._filename)
-            self._control_box.set_sensitive(True)
+            self._init_file_tree(path)
         elif os.path.isdir(path):
             self._init_file_list(path)
             if len(self._file_list) > 0:
@@ -171,10 +412,88 @@ class PictureView(gtk.VBox):
                 self._scale_pixbuf()
                 self.emit("filename-changed", self._filename)
                 self._control_box.set_sensitive(True)
+            else:
+                self.emit("load-failed", path, "No image found in %s" % path)
+        elif not os.path.exists(path):
+            self.emit("load-failed", path, "No such file or directory")
+        else:
+            self.emit("load-failed", path, "Not a supported image file")
+                
+    def _show_pixbuf(self, path, pixbuf):
+        self._filename = path
+        self._pixbuf = pixbuf
+        self._scale_pixbuf()
+        if self._file_mode == FILEMODE_TREE:
+            if not self._in_tree(path):
+                self._init_file_tree(os.path.dirname(path))
+            elif path in self._file_list:
+                self._index = self._file_list.index(path)
+        elif self._file_mode != FILEMODE_LIST:
+            self._init_file_list(os.path.dirname(path))
+        self.emit("filename-changed", self._filename)
+        self._control_box.set_sensitive(True)
+        
+    def _cb_load_done(self, future):
+        if future != self._pending_load: return
+        self._pending_load = None
+        if future.cancelled(): return
+        error = future.exception()
+        if error != None:
+            self.emit("load-failed", future.path, str(error))
+            return
+        self._show_pixbuf(future.path, future.result())
+        if self._restore_scroll != None:
+            path, x, y = self._restore_scroll
+            self._restore_scroll = None
+            if path == future.path:
+                #after the picture got its size allocated
+                gobject.idle_add(self._cb_restore_scroll, x, y)
+        self._prefetch_next()
+        
+    def _cb_restore_scroll(self, x, y):
+        self._current_sw.get_hadjustment().set_value(x)
+        self._current_sw.get_vadjustment().set_value(y)
+        return False
+        
+    def _chain_load(self, outer, path):
+        #resolve the future outer (returned by load_async() for a tree
+        #root) with the picture path
+        inner = self._loader.load(path, outer.priority)
+        inner.add_done_callback(self._cb_chain_load, outer)
+        outer.add_done_callback(self._cb_chain_cancel, inner)
+        
+    def _cb_chain_load(self, inner, outer):
+        if inner.cancelled():
+            outer.cancel()
+            return
+        #the future refers to the picture from now on
+        outer.path = inner.path
+        error = inner.exception()
+        if error != None:
+            outer.set_exception(error)
+        else:
+            outer.set_result(inner.result())
+            
+    def _cb_chain_cancel(self, outer, inner):
+        if outer.cancelled():
+            inner.cancel()
+        
+    def _prefetch_next(self):
+        if self._file_mode == FILEMODE_SINGLE: return
+        if len(self._file_list) < 2: return
+        if self._filename in self._file_list:
+            index = self._file_list.index(self._filename)
+        else:
+            index = self._index
+        #prefetch in the direction the user is browsing
+        path = self._file_list[(index + self._direction) % len(self._file_list)]
+        self._prefetch_load = self._loader.load(path, PRIORITY_PREFETCH)
         
     def do_get_property(self, property):
         if property.name == "mode":
             return self._mode
+        elif property.name == "file-mode":
+            return self._file_mode
         elif property.name == "filename":
             return self._filename
         elif property.name == "show-navigation":
@@ -185,6 +504,12 @@ class PictureView(gtk.VBox):
             return self._zoom
         elif property.name == "fullscreen":
             return self._fullscreen
+        elif property.name == "tree-max-depth":
+            return self._tree_max_depth
+        elif property.name == "tree-exclude":
+            return self._tree_exclude
+        elif property.name == "show-statistics":
+            return self._show_statistics
         else:
             raise AttributeError, "Property %s does not exist." % property.name
 
@@ -199,16 +524,17 @@ class PictureView(gtk.VBox):
             elif value == FILEMODE_SINGLE:
                 self._hbox_navigation.set_property("visible", False)
                 self._separator_navigation.set_property("visible", False)
-            elif value == FILEMODE_LIST:
+            elif value in [FILEMODE_LIST, FILEMODE_TREE]:
                 self._hbox_navigation.set_property("visible", True)
                 self._separator_navigation.set_property("visible", True)
+            if FILEMODE_TREE in [value, self._file_mode] and value != self._file_mode:
+                #the file list has to be rebuilt for the new mode
+                self.cancel_tree_walk()
+                self._dir = ""
             self._file_mode = value
             self._info_changed()
         elif property.name == "filename":
-            try:
-                self._load_path(value)
-            except:
-                pass
+            self._try_load_path(value)
         elif property.name == "show-navigation":
             self._show_navigation = value
             if value:
@@ -228,6 +554,19 @@ class PictureView(gtk.VBox):
         elif property.name == "fullscreen":
             self._fullscreen = value
             self._update_fullscreen()
+        elif property.name == "tree-max-depth":
+            self._tree_max_depth = value
+        elif property.name == "tree-exclude":
+            self._tree_exclude = value
+        elif property.name == "show-statistics":
+            if value and self._statistics_panel == None:
+                try:
+                    self._init_statistics_panel()
+                except ImportError:
+                    self._show_statistics = False
+                    raise
+            self._show_statistics = value
+            self._update_statistics()
         else:
             raise AttributeError, "Property %s does not exist." % property.name
 
@@ -315,8 +654,33 @@ class PictureView(gtk.VBox):
         self.pack_start(hbox, False, False)
         self._control_box = hbox
         
+    def _scale_render(self):
+        #the render of a restored session is shown until the picture
+        #itself is loaded
+        if self._render == None: return
+        pb = self._render
+        if self._mode == MODE_FIT_WINDOW:
+            self._current_sw.set_policy(gtk.POLICY_NEVER, gtk.POLICY_NEVER)
+            s_x, s_y, s_width, s_height = self._current_sw.get_allocation()
+            r_width = pb.get_width()
+            r_height = pb.get_height()
+            f = min(float(s_width) / r_width, float(s_height) / r_height)
+            #the render is not enlarged beyond the size of the picture
+            if self._zoom > 0:
+                f = min(f, 1.0 / self._zoom)
+            if f != 1.0 and s_width > 1 and s_height > 1:
+                pb = pb.scale_simple(max(1, int(r_width * f)),
+                                        max(1, int(r_height * f)),
+                                        gtk.gdk.INTERP_BILINEAR)
+        else:
+            self._current_sw.set_policy(gtk.POLICY_AUTOMATIC, gtk.POLICY_AUTOMATIC)
+        self._current_image.set_from_pixbuf(pb)
+        
     def _scale_pixbuf(self):
-        if self._pixbuf == None: return
+        if self._pixbuf == None:
+            self._scale_render()
+            return
+        self._render = None
         p_width = self._pixbuf.get_width()
         p_height = self._pixbuf.get_height()
         
@@ -352,6 +716,88 @@ class PictureView(gtk.VBox):
     def _cb_allocate(self, widget, allocation):
         self._scale_pixbuf()
         
+    def _cb_destroy(self, widget):
+        self.cancel_tree_walk()
+        for future in [self._pending_load, self._prefetch_load]:
+            if future != None:
+                future.cancel()
+        #saved last, an error must not prevent the cleanup above
+        self.save_session()
+        
+    def _get_scroll(self):
+        return (self._current_sw.get_hadjustment().value,
+                self._current_sw.get_vadjustment().value)
+        
+    def _get_render(self):
+        if self._pixbuf == None: return None
+        pb = self._current_image.get_pixbuf()
+        if pb == None: return None
+        width = pb.get_width()
+        height = pb.get_height()
+        if self._mode == MODE_FIXED_ZOOM:
+            #keep the zoom, only the visible part is saved
+            x, y = map(int, self._get_scroll())
+            w = min(int(self._current_sw.get_hadjustment().page_size),
+                    gtk.gdk.screen_width(), width - x)
+            h = min(int(self._current_sw.get_vadjustment().page_size),
+                    gtk.gdk.screen_height(), height - y)
+            if w > 0 and h > 0 and (w < width or h < height):
+                pb = pb.subpixbuf(x, y, w, h)
+            return pb
+        f = min(1.0, float(gtk.gdk.screen_width()) / width,
+                float(gtk.gdk.screen_height()) / height)
+        if f < 1.0:
+            pb = pb.scale_simple(int(width * f), int(height * f),
+                                    gtk.gdk.INTERP_BILINEAR)
+        return pb
+        
+    def _check_session(self, snapshot):
+        #runs in a separate thread, see restore_session()
+        if snapshot.file_mode == FILEMODE_TREE:
+            #the tree is walked again when the picture is loaded
+            files = None
+        elif snapshot.file_mode == FILEMODE_LIST:
+            files = filter(os.path.isfile, snapshot.file_list)
+        elif snapshot.is_current(SUPPORTED_EXTENSIONS):
+            files = snapshot.file_list
+        elif os.path.isdir(snapshot.dir):
+            files = map(lambda x: os.path.abspath(snapshot.dir + os.sep + x),
+                        get_image_files(snapshot.dir))
+        else:
+            files = []
+        gobject.idle_add(self._cb_session_checked, snapshot, files)
+        
+    def _cb_session_checked(self, snapshot, files):
+        navigated = self._filename != snapshot.filename or\
+                    self._pixbuf != None or self._pending_load != None
+        if files == None:
+            if self._dir == snapshot.dir and self._tree_walker == None:
+                #still the restored tree: walk it, the restored list is
+                #shown until the first batch arrives
+                self._dir = ""
+                self._init_file_tree(snapshot.dir, True)
+            if not navigated:
+                self.load_async(snapshot.filename)
+            return False
+        if navigated:
+            #another picture was loaded in the meantime
+            return False
+        self._file_list = files
+        if self._file_mode != FILEMODE_LIST:
+            self._dir = snapshot.dir
+        if snapshot.filename in files:
+            self._index = files.index(snapshot.filename)
+        elif files:
+            self._index = min(snapshot.index, len(files) - 1)
+        else:
+            self._index = 0
+            self._render = None
+            self._current_image.clear()
+            self._info_changed()
+            return False
+        self.load_async(files[self._index])
+        return False
+        
     def _cb_button_fit(self, button):
         self._scrolled.set_size_request(0, 0)
         self.set_property("mode", MODE_FIT_WINDOW)
@@ -379,13 +825,32 @@ class PictureView(gtk.VBox):
         
     def _cb_filename_changed(self, widget, filename):
         self._info_changed()
+        self._update_statistics()
+        
+    def _init_statistics_panel(self):
+        #numpy is only needed if the statistics are shown
+        from picture_view.statistics import StatisticsPanel
+        self._statistics_panel = StatisticsPanel()
+        self.pack_start(self._statistics_panel, False, False)
+        self.reorder_child(self._statistics_panel, 1)
+        
+    def _update_statistics(self):
+        if self._show_statistics:
+            self._statistics_panel.set_pixbuf(self._pixbuf)
+            self._statistics_panel.show_all()
+        elif self._statistics_panel != None:
+            self._statistics_panel.hide()
+            self._statistics_panel.set_pixbuf(None)
         
     def _info_changed(self):
         self.grab_focus()
+        self._update_info_label()
+        
+    def _update_info_label(self):
         fn = os.path.basename(self._filename)
         txt = "%s" % fn
         if self._show_navigation:
-            if self._file_mode in [FILEMODE_DIR, FILEMODE_LIST]:
+            if self._file_mode in [FILEMODE_DIR, FILEMODE_LIST, FILEMODE_TREE]:
                 txt = "%s (%s/%s)" % (fn, self._index + 1, len(self._file_list))
             else:
                 txt = fn
@@ -406,6 +871,8 @@ class PictureView(gtk.VBox):
             self._cb_button_zoom_in(widget)
         elif event.keyval == 45:
             self._cb_button_zoom_out(widget)
+        elif event.keyval == 104:
+            self.set_property("show-statistics", not self._show_statistics)
         elif event.keyval == 65480 and not self._fullscreen:
             self.set_property("fullscreen", True)
         elif event.keyval == 65307 or (event.keyval == 65480 and self._fullscreen):
@@ -447,30 +914,116 @@ class PictureView(gtk.VBox):
     def next(self):
         """
         Load the next picture that's in the same directory as the
-        current picture.
+        current picture. The picture is loaded with load_async().
         """
         if self._file_mode == FILEMODE_SINGLE: return
+        if not self._file_list: return
         if self._index < len(self._file_list) - 1:
             fn = self._file_list[self._index + 1]
             self._index += 1
         else:
             fn = self._file_list[0]
             self._index = 0
-        self.set_property("filename", fn)
+        self._direction = 1
+        self.load_async(fn)
         
     def previous(self):
         """
         Load the previous picture that's in the same directory as the
-        current picture.
+        current picture. The picture is loaded with load_async().
         """
         if self._file_mode == FILEMODE_SINGLE: return
+        if not self._file_list: return
         if self._index > 0:
             fn = self._file_list[self._index - 1]
             self._index -= 1
         else:
             fn = self._file_list[len(self._file_list) - 1]
             self._index = len(self._file_list) - 1
-        self.set_property("filename", fn)
+        self._direction = -1
+        self.load_async(fn)
+        
+    def load_async(self, path, priority=PRIORITY_VISIBLE):
+        """
+        Load the picture specified by path without blocking the main
+        loop and display it once it is decoded. If path is a directory,
+        the first picture in it is loaded (in FILEMODE_TREE the first
+        picture the walk finds). A load started before is cancelled.
+        The returned future is resolved in the main loop. If decoding
+        fails, future.result() raises the error and the 'load-failed'
+        signal is emitted.
+        After the picture is shown, the next picture of the file list
+        (the previous one if the user is browsing backwards) is
+        prefetched with PRIORITY_PREFETCH.
+        
+        @param path: the path to the picture to load
+        @type path: string
+        @param priority: PRIORITY_VISIBLE (default) or PRIORITY_PREFETCH
+        @type priority: int.
+        
+        @return: picture_view.loader.LoadFuture.
+        """
+        path = os.path.abspath(path)
+        if self._pending_load != None:
+            self._pending_load.cancel()
+            self._pending_load = None
+        if os.path.isdir(path) and self._file_mode == FILEMODE_TREE:
+            self._take_prefetch(path)
+            future = LoadFuture(path, priority)
+            self._pending_load = future
+            future.add_done_callback(self._cb_load_done)
+            if path == self._dir and self._file_list:
+                self._chain_load(future, self._file_list[0])
+            else:
+                #resolved when the first batch arrives
+                if self._tree_walker == None:
+                    #walk the tree again if it was empty
+                    self._dir = ""
+                self._filename = path
+                self._init_file_tree(path)
+            return future
+        elif os.path.isdir(path):
+            files = get_image_files(path)
+            if not files:
+                self._take_prefetch(path)
+                future = LoadFuture(path, priority)
+                future.set_exception(IOError("No image found in %s" % path))
+                self._pending_load = future
+                future.add_done_callback(self._cb_load_done)
+                return future
+            path = os.path.join(path, files[0])
+        prefetch = self._prefetch_load
+        self._prefetch_load = None
+        if prefetch != None and prefetch.path == path and\
+                (prefetch.running() or prefetch.done()) and\
+                not prefetch.cancelled():
+            #the picture is (being) decoded already
+            future = prefetch
+        else:
+            if prefetch != None:
+                prefetch.cancel()
+            future = self._loader.load(path, priority)
+        self._pending_load = future
+        future.add_done_callback(self._cb_load_done)
+        return future
+        
+    def set_loader(self, loader):
+        """
+        Set the picture_view.loader.Loader used by load_async(). By
+        default all views share one loader, so the number of pictures
+        decoded at the same time is limited for the whole application.
+        
+        @type loader: picture_view.loader.Loader.
+        """
+        self._loader = loader
+        
+    def get_loader(self):
+        """
+        Returns the loader used by load_async().
+        
+        @return: picture_view.loader.Loader.
+        """
+        return self._loader
         
     def set_background_color(self, color):
         """
@@ -492,11 +1045,15 @@ class PictureView(gtk.VBox):
     def set_filemode(self, mode):
         """
         Set whether the widget should show all images in the directory
-        (FILEMODE_DIR), only a single image (FILEMODE_SINGLE) or a list
-        of images (FILEMODE_LIST).
+        (FILEMODE_DIR), only a single image (FILEMODE_SINGLE), a list
+        of images (FILEMODE_LIST) or all images in the directory and its
+        subdirectories (FILEMODE_TREE).
         If mode is FILEMODE_SINGLE, the navigation controls are hidden.
         If mode is FILEMODE_LIST, a file list has to be given by calling
         set_file_list().
+        If mode is FILEMODE_TREE, the subdirectories are searched in a
+        background thread and the file list grows while the search runs
+        (see set_tree_max_depth() and set_tree_exclude()).
         
         @param mode: the file mode
         @type mode: one of the file mode constants above
@@ -584,6 +1141,36 @@ class PictureView(gtk.VBox):
         """
         return self.get_property("show-navigation")
         
+    def set_show_statistics(self, show):
+        """
+        Set whether a histogram and basic statistics (min, max, mean,
+        clipped pixels) of the current picture should be shown below
+        the picture. Requires numpy.
+        
+        @type show: boolean.
+        """
+        self.set_property("show-statistics", show)
+        
+    def get_show_statistics(self):
+        """
+        Returns True if the statistics panel is shown.
+        
+        @return: boolean.
+        """
+        return self.get_property("show-statistics")
+        
+    def get_statistics(self):
+        """
+        Returns the statistics of the current picture (see
+        picture_view.statistics.ImageStatistics) or None if the
+        statistics panel is not shown or they are not computed yet.
+        
+        @return: ImageStatistics or None.
+        """
+        if not self._show_statistics or self._statistics_panel == None:
+            return None
+        return self._statistics_panel.get_statistics()
+        
     def set_zoom(self, zoom):
         """
         Use this method to set the zoom level manually. If set, the
@@ -602,6 +1189,135 @@ class PictureView(gtk.VBox):
         """
         return self.get_property("zoom")
         
+    def set_tree_max_depth(self, depth):
+        """
+        Set how deep subdirectories are searched in FILEMODE_TREE.
+        0 means only the directory itself, -1 (default) means no limit.
+        Takes effect when the next tree is loaded.
+        
+        @type depth: int.
+        """
+        self.set_property("tree-max-depth", depth)
+        
+    def get_tree_max_depth(self):
+        """
+        Returns the maximum depth of subdirectories in FILEMODE_TREE.
+        
+        @return: int.
+        """
+        return self.get_property("tree-max-depth")
+        
+    def set_tree_exclude(self, patterns):
+        """
+        Set a list of shell-style patterns (e.g. ['.*', 'thumbs']).
+        Files and directories matching one of them are skipped in
+        FILEMODE_TREE. Takes effect when the next tree is loaded.
+        
+        @type patterns: list of strings.
+        """
+        self.set_property("tree-exclude", patterns)
+        
+    def get_tree_exclude(self):
+        """
+        Returns the list of exclude patterns used in FILEMODE_TREE.
+        
+        @return: list of strings.
+        """
+        return self.get_property("tree-exclude")
+        
+    def cancel_tree_walk(self):
+        """
+        Stop searching subdirectories in FILEMODE_TREE. The images found
+        so far stay in the file list.
+        """
+        if self._tree_walker != None:
+            self._tree_walker.cancel()
+            self._tree_walker = None
+        
+    def set_session_file(self, filename):
+        """
+        Set the file the session snapshot is saved to when the view is
+        destroyed and restored from by restore_session(). The snapshot
+        contains the file list, the current picture, the zoom settings
+        and a screen-sized render of the picture.
+        An empty string (default) disables saving the session.
+        
+        @param filename: the path to the session file
+        @type filename: string.
+        """
+        self._session_file = filename
+        
+    def get_session_file(self):
+        """
+        Returns the path to the session file (see set_session_file()).
+        
+        @return: string.
+        """
+        return self._session_file
+        
+    def save_session(self):
+        """
+        Save the session snapshot to the session file. This is done
+        automatically when the view is destroyed.
+        """
+        if not self._session_file or self._pixbuf == None: return
+        snapshot = Snapshot()
+        snapshot.filename = self._filename
+        if self._dir:
+            snapshot.dir = self._dir
+        else:
+            snapshot.dir = os.path.dirname(self._filename)
+        snapshot.dir_mtime = get_dir_mtime(snapshot.dir)
+        snapshot.file_list = self._file_list
+        snapshot.index = self._index
+        snapshot.file_mode = self._file_mode
+        snapshot.mode = self._mode
+        snapshot.zoom = self._zoom
+        if self._mode == MODE_FIXED_ZOOM:
+            snapshot.scroll_x, snapshot.scroll_y = self._get_scroll()
+        snapshot.extensions = SUPPORTED_EXTENSIONS
+        snapshot.render = self._get_render()
+        snapshot.save(self._session_file)
+        
+    def restore_session(self):
+        """
+        Restore the session saved in the session file. The saved render
+        of the picture and the saved file list are shown immediately.
+        The directory is checked in a background thread (and only
+        rescanned if it was modified), then the picture is loaded with
+        load_async() and replaces the render.
+        Returns False if there is no session to restore.
+        
+        @return: boolean.
+        """
+        if not self._session_file: return False
+        snapshot = load_snapshot(self._session_file)
+        if snapshot == None: return False
+        self.set_property("file-mode", snapshot.file_mode)
+        self._mode = snapshot.mode
+        self._zoom = snapshot.zoom
+        self._pixbuf = None
+        if snapshot.file_mode == FILEMODE_TREE:
+            #keeps navigation inside the restored tree until it is walked
+            self._dir = snapshot.dir
+        else:
+            self._dir = ""
+        self._filename = snapshot.filename
+        self._file_list = list(snapshot.file_list)
+        self._index = snapshot.index
+        self._render = snapshot.render
+        if snapshot.mode == MODE_FIXED_ZOOM:
+            self._restore_scroll = (snapshot.filename, snapshot.scroll_x,
+                                    snapshot.scroll_y)
+        self._scale_render()
+        self.emit("filename-changed", self._filename)
+        self.emit("zoom-changed", self._zoom)
+        self._control_box.set_sensitive(True)
+        thread = threading.Thread(target=self._check_session, args=(snapshot,))
+        thread.setDaemon(True)
+        thread.start()
+        return True
+        
     def set_file_list(self, files):
         """
         Set a list of files that should be shown. This sets the file
@@ -613,4 +1329,4 @@ class PictureView(gtk.VBox):
         self.set_property("file-mode", FILEMODE_LIST)
         self._file_list = files
         self._index = 0
-        self._load_path(files[0])
+        self._try_load_path(files[0])